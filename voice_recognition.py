@@ -1,34 +1,58 @@
 import sys
-import queue
+import ctypes
+import gc
 import json
+import re
 import sounddevice as sd
 from vosk import Model, KaldiRecognizer
+import shutil
+import signal
 import threading
-import time
-from typing import Optional, Dict, List
+from collections import deque
+from statistics import fmean
+from typing import Optional, Dict, List, Deque
 import logging
 import os
 from vosk import SetLogLevel
 import urllib.request
 import zipfile
 
+# Prefer orjson for decoding Vosk's result blobs (~3x faster than the
+# stdlib parser); fall back to json when it isn't installed
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 class AdvancedVoiceRecognition:
-    def __init__(self, model_path: str = "vosk-model-en-us-daanzu-20200905", 
+    # Maximum number of queued blocks fed to Kaldi in one AcceptWaveform
+    # call. Batching amortizes the fixed per-call overhead when the
+    # consumer has fallen behind, but stays small enough that latency
+    # remains bounded when blocks keep arriving.
+    MAX_BATCH_BLOCKS = 4
+
+    def __init__(self, model_path: str = "vosk-model-en-us-daanzu-20200905",
                  sample_rate: int = 16000,
-                 device: Optional[int] = None):
+                 blocksize: int = 8000,
+                 device: Optional[int] = None,
+                 history_cap: int = 10_000):
         """
         Initialize the voice recognition system.
-        
+
         Args:
             model_path: Path to the Vosk model
             sample_rate: Audio sample rate
+            blocksize: Audio frames per block read from the stream
             device: Audio device ID (None for default)
+            history_cap: Maximum utterances retained in the recognition
+                history; the oldest entries are discarded beyond this
         """
         self.sample_rate = sample_rate
+        self.blocksize = blocksize
         self.device = device
-        self.q = queue.Queue()
         self.running = False
-        
+
         # Configure logging
         logging.basicConfig(
             level=logging.INFO,
@@ -52,30 +76,52 @@ class AdvancedVoiceRecognition:
             
         self.recognizer = KaldiRecognizer(self.model, sample_rate)
         self.recognizer.SetWords(True)  # Enable word timing
+
+        # The model and recognizer live for the whole session; freeze
+        # them out of the garbage collector so later GC cycles don't
+        # rescan the long-lived Vosk objects from the hot path.
+        gc.freeze()
         
-        # Store recognition history
-        self.recognition_history: List[Dict] = []
+        # Streaming (partial) hypothesis state
+        self.last_partial = ""
+        self._last_partial_raw = ""
+
+        # Store recognition history with a bounded capacity so long
+        # sessions can't grow memory without limit
+        self.recognition_history: Deque[Dict] = deque(maxlen=history_cap)
         
-        # Symbol mappings
-        self.symbol_mappings = {
+        # Symbol mappings; interned keys give dict.get the
+        # pointer-compare fast path for the common compiler-interned
+        # lookup strings, and the prebound .get skips the attribute and
+        # bound-method dance per lookup
+        self.symbol_mappings = {sys.intern(k): v for k, v in {
             "dash": "-",
             "hyphen": "-",
             "minus": "-"
-        }
-    
+        }.items()}
+        self._lookup = self.symbol_mappings.get
+
+        # Precompile the mappings into one alternation so each utterance
+        # costs a single C-side regex scan instead of a Python loop
+        self._symbol_re = re.compile(
+            r'\b(' + '|'.join(map(re.escape, self.symbol_mappings)) + r')\b',
+            re.IGNORECASE
+        )
+        self._symbol_sub = lambda m: self.symbol_mappings[m.group(0).lower()]
+        self._needles = tuple(self.symbol_mappings)
+
     def process_text(self, text: str) -> str:
         """Process recognized text to convert words to symbols"""
-        words = text.split()
-        processed_words = []
-        
-        for word in words:
-            # Convert word to lowercase for matching
-            lower_word = word.lower()
-            # Replace with symbol if it exists in mappings
-            processed_word = self.symbol_mappings.get(lower_word, word)
-            processed_words.append(processed_word)
-        
-        return " ".join(processed_words)
+        # Single-word utterances (common for voice commands) need no
+        # scanning at all: one lowercase and one dict lookup
+        if ' ' not in text:
+            return self._lookup(text.lower(), text)
+        # Most utterances mention no mapped word at all; a C-speed
+        # substring scan is much cheaper than running the regex engine
+        low = text.lower()
+        if not any(needle in low for needle in self._needles):
+            return text
+        return self._symbol_re.sub(self._symbol_sub, text)
     
     def download_model(self, model_name: str):
         """Download and extract the Vosk model"""
@@ -83,15 +129,40 @@ class AdvancedVoiceRecognition:
         model_url = f"https://alphacephei.com/vosk/models/{model_name}.zip"
         zip_path = f"{model_name}.zip"
         
+        # Copy with 1 MB buffers; the default 8 KB chunks drown a
+        # gigabyte-sized model in syscall and loop overhead
+        bufsize = 1 << 20
+
         try:
-            # Download the model
-            urllib.request.urlretrieve(model_url, zip_path)
-            
+            # Stream the download straight to disk
+            with urllib.request.urlopen(model_url) as response, \
+                    open(zip_path, 'wb') as f:
+                shutil.copyfileobj(response, f, bufsize)
+
             # Extract the model
             self.logger.info("Extracting model...")
+            extract_root = os.path.abspath('.')
             with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall('.')
-            
+                for info in zip_ref.infolist():
+                    # Resolve the destination and refuse entries whose
+                    # normalized path escapes the extraction root
+                    # (extractall sanitizes these; a manual loop must too)
+                    target = os.path.abspath(
+                        os.path.join(extract_root, info.filename)
+                    )
+                    if os.path.commonpath([extract_root, target]) != extract_root:
+                        self.logger.warning(
+                            "Skipping unsafe archive entry: %s", info.filename
+                        )
+                        continue
+                    if info.is_dir():
+                        os.makedirs(target, exist_ok=True)
+                        continue
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with zip_ref.open(info) as src, \
+                            open(target, 'wb') as dst:
+                        shutil.copyfileobj(src, dst, bufsize)
+
             # Clean up the zip file
             os.remove(zip_path)
             self.logger.info("Model downloaded and extracted successfully")
@@ -99,85 +170,148 @@ class AdvancedVoiceRecognition:
             self.logger.error(f"Failed to download model: {str(e)}")
             raise
         
-    def callback(self, indata, frames, time, status):
-        """Callback for audio stream processing"""
-        if status:
-            self.logger.warning(f"Audio callback status: {status}")
-        self.q.put(bytes(indata))
-        
     def process_audio_chunk(self, audio_chunk) -> Optional[Dict]:
         """Process a chunk of audio data and return recognition results"""
         if self.recognizer.AcceptWaveform(audio_chunk):
-            result = json.loads(self.recognizer.Result())
+            self.last_partial = ""
+            self._last_partial_raw = ""
+            result = _json_loads(self.recognizer.Result())
             if result.get("text"):
                 # Process text to convert words to symbols
                 result["text"] = self.process_text(result["text"])
                 return result
+        else:
+            # Check the partial hypothesis on every chunk (a chunk is
+            # already 0.5-2 s of audio here, so skipping chunks would
+            # stall streaming output), but only JSON-parse it when the
+            # raw string actually changed — string equality is a memcmp,
+            # far cheaper than a decode
+            raw = self.recognizer.PartialResult()
+            if raw != self._last_partial_raw:
+                self._last_partial_raw = raw
+                self.last_partial = _json_loads(raw).get("partial", "")
+                if self.last_partial:
+                    self.logger.debug("Partial: %s", self.last_partial)
         return None
         
+    def _boost_thread_priority(self):
+        """Raise the calling thread's scheduling priority.
+
+        Runs best-effort: elevating priority usually needs extra OS
+        privileges, so failures are logged at debug level and ignored.
+        """
+        try:
+            if hasattr(os, "sched_setscheduler"):
+                os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(20))
+            elif sys.platform == "win32":
+                THREAD_PRIORITY_TIME_CRITICAL = 15
+                kernel32 = ctypes.windll.kernel32
+                kernel32.SetThreadPriority(
+                    kernel32.GetCurrentThread(), THREAD_PRIORITY_TIME_CRITICAL
+                )
+        except (OSError, PermissionError) as e:
+            self.logger.debug(f"Could not raise thread priority: {str(e)}")
+
     def start_recognition(self):
         """Start continuous voice recognition"""
         self.running = True
-        
+        self._boost_thread_priority()
+
         try:
+            # No callback: PortAudio buffers internally and the
+            # recognition thread pulls blocks with blocking read()s,
+            # so audio goes straight to Kaldi without a second thread,
+            # an extra copy, or any Python-side queue.
             with sd.RawInputStream(
                 samplerate=self.sample_rate,
-                blocksize=8000,
+                blocksize=self.blocksize,
                 device=self.device,
                 dtype="int16",
                 channels=1,
-                callback=self.callback
-            ):
+                latency="low"
+            ) as stream:
                 self.logger.info("Started listening... Speak now! (Say 'dash' for -)")
-                
+
+                # Hoist hot lookups out of the loop so each iteration
+                # skips the attribute and bound-method dereferences
+                blocksize = self.blocksize
+                max_batch = self.MAX_BATCH_BLOCKS
+                stream_read = stream.read
+                process_chunk = self.process_audio_chunk
+                history_append = self.recognition_history.append
+
                 while self.running:
-                    try:
-                        audio_chunk = self.q.get()
-                        result = self.process_audio_chunk(audio_chunk)
-                        
-                        if result:
-                            self.recognition_history.append(result)
-                            
-                            # Print recognition results with confidence scores and timing
-                            text = result["text"]
-                            if "result" in result:
-                                # Calculate overall confidence
-                                conf = sum(word.get("conf", 0) for word in result["result"]) / len(result["result"])
-                                
-                                # Get timing information
-                                start_time = result["result"][0].get("start", 0)
-                                end_time = result["result"][-1].get("end", 0)
-                                
-                                self.logger.info(f"Recognized [{start_time:.2f}s - {end_time:.2f}s]: {text}")
-                                self.logger.info(f"Confidence: {conf:.2f}")
-                                
-                                # Log detailed word information
-                                for word in result["result"]:
-                                    word_conf = word.get("conf", 0)
+                    data, overflowed = stream_read(blocksize)
+                    if overflowed:
+                        self.logger.warning("Audio input overflow")
+                    # Drain whatever PortAudio has already buffered (up
+                    # to MAX_BATCH_BLOCKS total) into one waveform so
+                    # Kaldi's per-call overhead is amortized when the
+                    # consumer has fallen behind
+                    blocks = [bytes(data)]
+                    while (len(blocks) < max_batch
+                           and stream.read_available >= blocksize):
+                        data, overflowed = stream_read(blocksize)
+                        if overflowed:
+                            self.logger.warning("Audio input overflow")
+                        blocks.append(bytes(data))
+                    audio_chunk = blocks[0] if len(blocks) == 1 else b"".join(blocks)
+                    result = process_chunk(audio_chunk)
+
+                    if result:
+                        history_append(result)
+
+                        # Print recognition results with confidence scores
+                        # and timing; skip the whole block (including the
+                        # confidence math) when INFO records are discarded
+                        if not self.logger.isEnabledFor(logging.INFO):
+                            continue
+
+                        text = result["text"]
+                        if "result" in result:
+                            words = result["result"]
+
+                            # Extract confidences once, then average in C
+                            confs = [word.get("conf", 0.0) for word in words]
+
+                            self.logger.info(
+                                "Recognized [%.2fs - %.2fs]: %s",
+                                words[0].get("start", 0),
+                                words[-1].get("end", 0), text
+                            )
+                            self.logger.info("Confidence: %.2f", fmean(confs))
+
+                            # Log detailed word information; skip the loop
+                            # entirely unless DEBUG records would be emitted
+                            if self.logger.isEnabledFor(logging.DEBUG):
+                                for word, word_conf in zip(words, confs):
                                     if word_conf < 0.8:
                                         self.logger.debug(
-                                            f"Word: {word['word']:<20} "
-                                            f"Confidence: {word_conf:.2f} "
-                                            f"Time: [{word.get('start', 0):.2f}s - {word.get('end', 0):.2f}s]"
+                                            "Word: %-20s Confidence: %.2f "
+                                            "Time: [%.2fs - %.2fs]",
+                                            word['word'], word_conf,
+                                            word.get('start', 0), word.get('end', 0)
                                         )
-                            else:
-                                self.logger.info(f"Recognized: {text}")
-                                
-                    except queue.Empty:
-                        continue
-                        
+                        else:
+                            self.logger.info("Recognized: %s", text)
+
+
         except Exception as e:
             self.logger.error(f"Error in recognition: {str(e)}")
             self.stop_recognition()
             
     def stop_recognition(self):
-        """Stop the voice recognition"""
+        """Stop the voice recognition.
+
+        The consumer notices at its next blocking read, i.e. within one
+        block interval.
+        """
         self.running = False
         self.logger.info("Stopping voice recognition...")
         
     def get_recognition_history(self) -> List[Dict]:
         """Return the history of recognized speech"""
-        return self.recognition_history
+        return list(self.recognition_history)
         
     def clear_history(self):
         """Clear the recognition history"""
@@ -190,24 +324,25 @@ def main():
         logging.error(f"Failed to initialize voice recognition: {str(e)}")
         sys.exit(1)
         
-    try:
-        # Start recognition in a separate thread
-        recognition_thread = threading.Thread(target=recognizer.start_recognition)
-        recognition_thread.start()
-        
-        # Keep the main thread running and handle user input
-        print("Press Ctrl+C to stop recognition")
-        while True:
-            time.sleep(0.1)
-            
-    except KeyboardInterrupt:
-        recognizer.stop_recognition()
-        recognition_thread.join()
-        
-        # Print final statistics
-        history = recognizer.get_recognition_history()
-        print(f"\nRecognition session completed.")
-        print(f"Total utterances recognized: {len(history)}")
+    # Start recognition in a separate thread
+    recognition_thread = threading.Thread(target=recognizer.start_recognition)
+    recognition_thread.start()
+
+    # Block the main thread on an event instead of a sleep loop; Ctrl+C
+    # sets the event and shutdown proceeds immediately
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+
+    print("Press Ctrl+C to stop recognition")
+    stop_event.wait()
+
+    recognizer.stop_recognition()
+    recognition_thread.join()
+
+    # Print final statistics
+    history = recognizer.get_recognition_history()
+    print(f"\nRecognition session completed.")
+    print(f"Total utterances recognized: {len(history)}")
         
 if __name__ == "__main__":
     main() 
\ No newline at end of file